@@ -21,78 +21,271 @@ Examples:
 """
 
 import os
+import functools
 import json
 import re
+import sys
+import threading
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from difflib import SequenceMatcher
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 
+try:
+    # Native Indel (LCS-based) similarity for --rapidfuzz, much faster than difflib
+    from rapidfuzz.distance import Indel
+except ImportError:
+    Indel = None
+
+try:
+    # C-accelerated JSON parsing and serialization
+    import orjson
+except ImportError:
+    orjson = None
+
+# Label lines (starting with . or letter, ending with :)
+_LABEL_RE = re.compile(r'^[.a-zA-Z_][a-zA-Z0-9_.]*:\s*$')
+
+@functools.lru_cache(maxsize=1 << 16)
 def normalize_assembly_line(line: str) -> str:
     """Normalize assembly code line by removing comments and extra whitespace"""
-    # Remove trailing comments
-    if '#' in line:
-        line = line[:line.index('#')]
-    if ';' in line:
-        line = line[:line.index(';')]
-    # Strip leading/trailing whitespace
-    line = line.strip()
-    return line
+    # Remove trailing comments (one scan per separator), then strip whitespace
+    return line.partition('#')[0].partition(';')[0].strip()
+
+def _parse_asm(lines: List[str]) -> Tuple[List[str], List[str]]:
+    """Normalize assembly lines once, returning (normalized lines, instruction sequence)"""
+    is_label = _LABEL_RE.match
+    intern = sys.intern
+    # Normalize, then take mnemonics of non-directive, non-label lines
+    normalized_lines = [line for line in map(normalize_assembly_line, lines) if line]
+    # Stripped lines can only be labels if they end in ':'
+    instructions = [intern(line.split(None, 1)[0]) for line in normalized_lines
+                    if line[0] != '.' and not (line[-1] == ':' and is_label(line))]
+    return normalized_lines, instructions
 
 def extract_instructions(lines: List[str]) -> List[str]:
     """Extract instruction sequence (removing labels, comments, empty lines)"""
-    instructions = []
-    for line in lines:
-        normalized = normalize_assembly_line(line)
-        if not normalized:
-            continue
-        # Skip label lines (starting with . or letter, ending with :)
-        if re.match(r'^[.a-zA-Z_][a-zA-Z0-9_.]*:\s*$', normalized):
-            continue
-        # Skip directives (starting with . but not a label)
-        if normalized.startswith('.'):
-            continue
-        # Extract instruction (first word)
-        parts = normalized.split()
-        if parts:
-            instructions.append(parts[0])
-    return instructions
+    return _parse_asm(lines)[1]
 
-def calculate_similarity(file1_path: str, file2_path: str) -> Dict[str, float]:
-    """Calculate similarity between two assembly files"""
+# Holds one SequenceMatcher per thread, reused for every comparison
+_thread_state = threading.local()
+
+def _sequence_matcher() -> SequenceMatcher:
+    """Return this thread's reusable SequenceMatcher"""
+    matcher = getattr(_thread_state, 'sequence_matcher', None)
+    if matcher is None:
+        # autojunk is disabled: its "popular element" heuristic only costs time on
+        # these short sequences and skews the ratio of long ones (200+ items)
+        # where common mnemonics get junked
+        matcher = _thread_state.sequence_matcher = SequenceMatcher(autojunk=False)
+    return matcher
+
+def _sequence_ratio(seq1: List[str], seq2: List[str], use_rapidfuzz: bool = False) -> float:
+    """Similarity ratio of two sequences in [0, 1] (difflib, or rapidfuzz Indel if requested)"""
+    # Identical inputs are common and need no matching at all
+    if seq1 == seq2:
+        return 1.0
+    if use_rapidfuzz:
+        return Indel.normalized_similarity(seq1, seq2)
+    matcher = _sequence_matcher()
+    matcher.set_seqs(seq1, seq2)
+    return matcher.ratio()
+
+def _ngrams(seq: List[str], n: int) -> set:
+    """Set of n-grams of a sequence; a sequence shorter than n is a single gram"""
+    if len(seq) < n:
+        return {tuple(seq)}
+    return set(zip(*(seq[i:] for i in range(n))))
+
+def _ngram_jaccard(seq1: List[str], seq2: List[str], n: int = 3) -> float:
+    """Jaccard similarity of the n-gram sets of two sequences, linear time"""
+    if seq1 == seq2:
+        return 1.0
+    grams1 = _ngrams(seq1, n)
+    grams2 = _ngrams(seq2, n)
+    return len(grams1 & grams2) / len(grams1 | grams2)
+
+def _empty_similarity() -> Dict[str, float]:
+    """Similarity reported when one of the files is missing"""
+    return {
+        'line_similarity': 0.0,
+        'instruction_similarity': 0.0,
+        'overall_similarity': 0.0
+    }
+
+def _read_lines(path) -> Optional[List[str]]:
+    """Read all lines of a file in a single call, or None if it does not exist"""
     try:
-        with open(file1_path, 'r', encoding='utf-8') as f:
-            lines1 = f.readlines()
-        with open(file2_path, 'r', encoding='utf-8') as f:
-            lines2 = f.readlines()
+        data = Path(path).read_bytes()
     except FileNotFoundError:
-        return {
-            'line_similarity': 0.0,
-            'instruction_similarity': 0.0,
-            'overall_similarity': 0.0
-        }
+        return None
+    return data.decode('utf-8', 'replace').splitlines()
+
+def calculate_similarity(
+    file1_path: str,
+    file2_path: str,
+    fast_instr_sim: bool = False,
+    use_rapidfuzz: bool = False
+) -> Dict[str, float]:
+    """Calculate similarity between two assembly files"""
+    lines1 = _read_lines(file1_path)
+    lines2 = _read_lines(file2_path)
+    if lines1 is None or lines2 is None:
+        return _empty_similarity()
+    return _similarity_from_lines(lines1, lines2, fast_instr_sim, use_rapidfuzz)
+
+def _similarity_from_lines(
+    lines1: List[str],
+    lines2: List[str],
+    fast_instr_sim: bool = False,
+    use_rapidfuzz: bool = False
+) -> Dict[str, float]:
+    """
+    Calculate similarity between two assembly listings given as lines
     
+    With fast_instr_sim, instruction similarity is the Jaccard similarity of
+    opcode trigrams (linear time) instead of a sequence matching ratio.
+    With use_rapidfuzz, sequences are compared by rapidfuzz's Indel (LCS)
+    similarity instead of difflib, and the result is tagged with 'method'.
+    """
     # 1. Line-level similarity (after removing empty lines and comments)
-    normalized_lines1 = [normalize_assembly_line(line) for line in lines1]
-    normalized_lines2 = [normalize_assembly_line(line) for line in lines2]
-    normalized_lines1 = [line for line in normalized_lines1 if line]
-    normalized_lines2 = [line for line in normalized_lines2 if line]
+    normalized_lines1, instructions1 = _parse_asm(lines1)
+    normalized_lines2, instructions2 = _parse_asm(lines2)
     
-    line_similarity = SequenceMatcher(None, normalized_lines1, normalized_lines2).ratio()
+    line_similarity = _sequence_ratio(normalized_lines1, normalized_lines2, use_rapidfuzz)
     
     # 2. Instruction sequence similarity
-    instructions1 = extract_instructions(lines1)
-    instructions2 = extract_instructions(lines2)
-    instruction_similarity = SequenceMatcher(None, instructions1, instructions2).ratio() if instructions1 or instructions2 else 0.0
+    if not instructions1 and not instructions2:
+        instruction_similarity = 0.0
+    elif fast_instr_sim:
+        instruction_similarity = _ngram_jaccard(instructions1, instructions2)
+    else:
+        instruction_similarity = _sequence_ratio(instructions1, instructions2, use_rapidfuzz)
     
     # 3. Overall similarity (weighted average)
     overall_similarity = (line_similarity * 0.6 + instruction_similarity * 0.4)
     
-    return {
+    similarity = {
         'line_similarity': round(line_similarity, 4),
         'instruction_similarity': round(instruction_similarity, 4),
         'overall_similarity': round(overall_similarity, 4)
     }
+    if use_rapidfuzz:
+        # LCS-based scores run noticeably higher than difflib's, keep them apart
+        similarity['method'] = 'rapidfuzz_indel'
+    return similarity
+
+def _load_json(path: Path):
+    """Load a JSON file, using orjson when available"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson rejects the NaN/Infinity tokens that json.dump writes by default
+            return json.loads(raw)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _dump_json(data, path: Path):
+    """Write data as 2-space indented JSON (stdlib json, which keeps NaN/Infinity intact)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def _summarize_status(sample_data: Dict) -> str:
+    """Summarize test case statuses of a sample, e.g. '2 failed, 8 success'"""
+    if 'test_cases' not in sample_data:
+        return ""
+    status_counts = {}
+    for test_case in sample_data['test_cases']:
+        status = test_case.get('status', 'unknown')
+        status_counts[status] = status_counts.get(status, 0) + 1
+    
+    # Format status summary
+    status_parts = []
+    for status, count in sorted(status_counts.items()):
+        status_parts.append(f"{count} {status}")
+    return ", ".join(status_parts)
+
+def _process_one(task: Tuple[Path, str, str, str, str, bool, bool, bool, bool]) -> Tuple[Optional[Dict], List[str]]:
+    """
+    Process a single problem directory
+    
+    Returns (result, log_lines); result is None if the directory was skipped.
+    Log lines are returned rather than printed so output stays in directory order
+    when problems are processed in parallel.
+    """
+    (problem_dir, generated_file, unoptimized_file, samples_json, sample_key,
+     update_json, force_update, fast_instr_sim, use_rapidfuzz) = task
+    log = []
+    problem_id = problem_dir.name
+    gen_file_path = problem_dir / generated_file
+    unopt_file_path = problem_dir / unoptimized_file
+    json_file_path = problem_dir / samples_json
+    
+    # A single directory listing tells which of the files are present
+    with os.scandir(problem_dir) as entries:
+        names = {entry.name for entry in entries}
+    
+    def present(name: str, path: Path) -> bool:
+        # Names with a subpath (e.g. out/opt.s) are not in the listing, stat those directly
+        return name in names if os.path.basename(name) == name else path.exists()
+    
+    # A missing file reads as None
+    lines1 = _read_lines(gen_file_path) if present(generated_file, gen_file_path) else None
+    lines2 = _read_lines(unopt_file_path) if present(unoptimized_file, unopt_file_path) else None
+    
+    if lines1 is None and lines2 is None:
+        log.append(f"Skipping {problem_id}: Missing both {generated_file} and {unoptimized_file}")
+        return None, log
+    
+    # Calculate similarity (use empty similarity if files are missing)
+    if lines1 is not None and lines2 is not None:
+        similarity = _similarity_from_lines(lines1, lines2, fast_instr_sim, use_rapidfuzz)
+    else:
+        # If one of the files is missing, set similarity to 0
+        similarity = _empty_similarity()
+        if lines1 is None:
+            log.append(f"  Warning: {problem_id} missing {generated_file}")
+        if lines2 is None:
+            log.append(f"  Warning: {problem_id} missing {unoptimized_file}")
+    
+    # Read JSON once; it is only written back when updating and the similarity changed
+    correct = False
+    status_summary = ""
+    if present(samples_json, json_file_path):
+        try:
+            data = _load_json(json_file_path)
+            sample_data = data.get('samples', {}).get(sample_key)
+            if sample_data is not None:
+                correct = sample_data.get('correct', False)
+                status_summary = _summarize_status(sample_data)
+            
+            if update_json:
+                # Update sample similarity information
+                changed = force_update
+                if sample_data is not None and sample_data.get('similarity') != similarity:
+                    sample_data['similarity'] = similarity
+                    changed = True
+                
+                # Save updated JSON, skipping the write when nothing changed
+                if changed:
+                    _dump_json(data, json_file_path)
+        # Decode errors (ValueError) and unexpected shapes, e.g. a list where an
+        # object is expected (AttributeError/TypeError), only fail this problem
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            log.append(f"✗ {problem_id}: JSON processing failed - {e}")
+    
+    log.append(f"✓ {problem_id}: Similarity = {similarity['overall_similarity']:.4f}")
+    
+    return {
+        'problem_id': problem_id,
+        'similarity': similarity,
+        'correct': correct,
+        'status': status_summary
+    }, log
 
 def process_all_problems(
     base_dir: str,
@@ -101,7 +294,12 @@ def process_all_problems(
     unoptimized_file: str = 'unoptimized.s',
     samples_json: str = 'samples.json',
     sample_key: str = '0',
-    update_json: bool = True
+    update_json: bool = True,
+    force_update: bool = False,
+    fast_instr_sim: bool = False,
+    use_rapidfuzz: bool = False,
+    workers: Optional[int] = None,
+    workers_kind: str = 'process'
 ) -> List[Dict]:
     """
     Process all problem directories
@@ -114,17 +312,33 @@ def process_all_problems(
         samples_json: JSON filename (default: 'samples.json')
         sample_key: Sample key in JSON (default: '0')
         update_json: Whether to update JSON file (default: True)
+        force_update: Rewrite JSON files even if similarity is unchanged (default: False)
+        fast_instr_sim: Use opcode trigram Jaccard for instruction similarity, never written to JSON (default: False)
+        use_rapidfuzz: Compare with rapidfuzz's Indel (LCS) similarity instead of difflib (default: False)
+        workers: Number of workers (default: CPU count, 1 disables the pool)
+        workers_kind: 'process' for CPU-bound runs, 'thread' when JSON/file I/O dominates (default: 'process')
     """
     base_path = Path(base_dir)
     if not base_path.exists():
         print(f"Error: Directory does not exist: {base_dir}")
         return []
     
+    if use_rapidfuzz and Indel is None:
+        print("Error: --rapidfuzz requires the rapidfuzz package (pip install rapidfuzz)")
+        return []
+    
+    # Jaccard scores are on a different scale, keep them out of samples.json
+    if fast_instr_sim:
+        update_json = False
+    
     results = []
     
-    # Find all directories matching the prefix
-    problem_dirs = sorted([d for d in base_path.iterdir() 
-                          if d.is_dir() and d.name.startswith(dir_prefix)])
+    # Find all directories matching the prefix (scandir reuses the file type
+    # from the directory listing instead of a stat call per entry)
+    with os.scandir(base_path) as entries:
+        problem_dirs = sorted((Path(entry.path) for entry in entries
+                               if entry.name.startswith(dir_prefix) and entry.is_dir()),
+                              key=lambda d: d.name)
     
     if not problem_dirs:
         print(f"Warning: No directories starting with '{dir_prefix}' found in {base_dir}")
@@ -132,99 +346,33 @@ def process_all_problems(
     
     print(f"Found {len(problem_dirs)} directories\n")
     
-    for problem_dir in problem_dirs:
-        problem_id = problem_dir.name
-        gen_file_path = problem_dir / generated_file
-        unopt_file_path = problem_dir / unoptimized_file
-        json_file_path = problem_dir / samples_json
-        
-        # Check if files exist
-        gen_exists = gen_file_path.exists()
-        unopt_exists = unopt_file_path.exists()
-        
-        if not gen_exists and not unopt_exists:
-            print(f"Skipping {problem_id}: Missing both {generated_file} and {unoptimized_file}")
-            continue
-        
-        # Calculate similarity (use empty similarity if files are missing)
-        if gen_exists and unopt_exists:
-            similarity = calculate_similarity(str(gen_file_path), str(unopt_file_path))
-        else:
-            # If one or both files are missing, set similarity to 0
-            similarity = {
-                'line_similarity': 0.0,
-                'instruction_similarity': 0.0,
-                'overall_similarity': 0.0
-            }
-            if not gen_exists:
-                print(f"  Warning: {problem_id} missing {generated_file}")
-            if not unopt_exists:
-                print(f"  Warning: {problem_id} missing {unoptimized_file}")
-        
-        # Read JSON (if exists and update is needed)
-        correct = False
-        status_summary = ""
-        if json_file_path.exists() and update_json:
-            try:
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Update sample similarity information
-                if 'samples' in data and sample_key in data['samples']:
-                    data['samples'][sample_key]['similarity'] = similarity
-                    correct = data.get('samples', {}).get(sample_key, {}).get('correct', False)
-                    
-                    # Extract status information from test_cases
-                    sample_data = data['samples'][sample_key]
-                    if 'test_cases' in sample_data:
-                        status_counts = {}
-                        for test_case in sample_data['test_cases']:
-                            status = test_case.get('status', 'unknown')
-                            status_counts[status] = status_counts.get(status, 0) + 1
-                        
-                        # Format status summary
-                        status_parts = []
-                        for status, count in sorted(status_counts.items()):
-                            status_parts.append(f"{count} {status}")
-                        status_summary = ", ".join(status_parts)
-                
-                # Save updated JSON
-                with open(json_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-                
-            except Exception as e:
-                print(f"✗ {problem_id}: JSON processing failed - {e}")
-        elif json_file_path.exists():
-            # Read only, don't update
-            try:
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                correct = data.get('samples', {}).get(sample_key, {}).get('correct', False)
-                
-                # Extract status information from test_cases
-                sample_data = data.get('samples', {}).get(sample_key, {})
-                if 'test_cases' in sample_data:
-                    status_counts = {}
-                    for test_case in sample_data['test_cases']:
-                        status = test_case.get('status', 'unknown')
-                        status_counts[status] = status_counts.get(status, 0) + 1
-                    
-                    # Format status summary
-                    status_parts = []
-                    for status, count in sorted(status_counts.items()):
-                        status_parts.append(f"{count} {status}")
-                    status_summary = ", ".join(status_parts)
-            except:
-                pass
-        
-        results.append({
-            'problem_id': problem_id,
-            'similarity': similarity,
-            'correct': correct,
-            'status': status_summary
-        })
-        
-        print(f"✓ {problem_id}: Similarity = {similarity['overall_similarity']:.4f}")
+    tasks = [(problem_dir, generated_file, unoptimized_file, samples_json, sample_key,
+              update_json, force_update, fast_instr_sim, use_rapidfuzz)
+             for problem_dir in problem_dirs]
+    
+    # Each problem is independent, so spread them across workers. Processes
+    # suit the CPU-bound matching (SequenceMatcher holds the GIL); threads
+    # avoid pickling and still overlap file I/O on slow filesystems
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(tasks) > 1:
+        executor_class = ThreadPoolExecutor if workers_kind == 'thread' else ProcessPoolExecutor
+        executor = executor_class(max_workers=workers)
+        outcomes = executor.map(_process_one, tasks, chunksize=8)
+    else:
+        outcomes = map(_process_one, tasks)
+    
+    # Outcomes arrive lazily in directory order, so progress prints as it goes
+    try:
+        for result, log in outcomes:
+            for line in log:
+                print(line)
+            if result is not None:
+                results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
     
     return results
 
@@ -259,25 +407,44 @@ def generate_report(results: List[Dict], output_file: str = None):
             f"{sim['instruction_similarity']:<12.4f} {correct:<8} {status:<30}"
         )
     
-    # Statistics
-    overall_sims = [r['similarity']['overall_similarity'] for r in results]
-    line_sims = [r['similarity']['line_similarity'] for r in results]
-    inst_sims = [r['similarity']['instruction_similarity'] for r in results]
+    # Statistics, accumulated in a single pass over the results
+    sum_overall = sum_line = sum_inst = 0.0
+    max_overall = max_line = max_inst = float('-inf')
+    min_overall = min_line = min_inst = float('inf')
+    inst_less_than_one = 0
+    correct_count = 0
+    for r in results:
+        sim = r['similarity']
+        overall = sim['overall_similarity']
+        line = sim['line_similarity']
+        inst = sim['instruction_similarity']
+        sum_overall += overall
+        sum_line += line
+        sum_inst += inst
+        max_overall = max(max_overall, overall)
+        max_line = max(max_line, line)
+        max_inst = max(max_inst, inst)
+        min_overall = min(min_overall, overall)
+        min_line = min(min_line, line)
+        min_inst = min(min_inst, inst)
+        # Count problems with instruction similarity < 1.0
+        if inst < 1.0:
+            inst_less_than_one += 1
+        if r['correct']:
+            correct_count += 1
+    count = len(results)
     
     report_lines.append("-" * 120)
     report_lines.append(f"\nStatistics:")
-    report_lines.append(f"  Overall Similarity - Average: {sum(overall_sims)/len(overall_sims):.4f}, "
-                       f"Max: {max(overall_sims):.4f}, Min: {min(overall_sims):.4f}")
-    report_lines.append(f"  Line Similarity - Average: {sum(line_sims)/len(line_sims):.4f}, "
-                       f"Max: {max(line_sims):.4f}, Min: {min(line_sims):.4f}")
-    report_lines.append(f"  Instruction Similarity - Average: {sum(inst_sims)/len(inst_sims):.4f}, "
-                       f"Max: {max(inst_sims):.4f}, Min: {min(inst_sims):.4f}")
-    
-    # Count problems with instruction similarity < 1.0
-    inst_less_than_one = sum(1 for sim in inst_sims if sim < 1.0)
+    report_lines.append(f"  Overall Similarity - Average: {sum_overall/count:.4f}, "
+                       f"Max: {max_overall:.4f}, Min: {min_overall:.4f}")
+    report_lines.append(f"  Line Similarity - Average: {sum_line/count:.4f}, "
+                       f"Max: {max_line:.4f}, Min: {min_line:.4f}")
+    report_lines.append(f"  Instruction Similarity - Average: {sum_inst/count:.4f}, "
+                       f"Max: {max_inst:.4f}, Min: {min_inst:.4f}")
+    
     report_lines.append(f"  Number of problems with instruction similarity < 1.0: {inst_less_than_one}")
     
-    correct_count = sum(1 for r in results if r['correct'])
     report_lines.append(f"\nCorrectness Statistics: {correct_count}/{len(results)} problems passed tests")
     
     report_lines.append("=" * 120)
@@ -353,6 +520,39 @@ Examples:
         help='Calculate similarity only, don\'t update JSON files'
     )
     
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Rewrite JSON files even if similarity is unchanged'
+    )
+    
+    parser.add_argument(
+        '--fast-instr-sim',
+        action='store_true',
+        help='Approximate instruction similarity with opcode trigram Jaccard (linear time, implies --no-update)'
+    )
+    
+    parser.add_argument(
+        '--rapidfuzz',
+        action='store_true',
+        help='Compare with rapidfuzz\'s Indel (LCS) similarity instead of difflib '
+             '(much faster, but scores run higher; requires rapidfuzz)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of workers (default: CPU count, 1 runs sequentially)'
+    )
+    
+    parser.add_argument(
+        '--workers-kind',
+        choices=['process', 'thread'],
+        default='process',
+        help='Use worker processes (CPU-bound) or threads (I/O-bound, e.g. cold filesystems) (default: process)'
+    )
+    
     parser.add_argument(
         '--output',
         type=str,
@@ -389,7 +589,12 @@ Examples:
         unoptimized_file=args.unoptimized,
         samples_json=args.samples_json,
         sample_key=args.sample_key,
-        update_json=not args.no_update
+        update_json=not args.no_update,
+        force_update=args.force,
+        fast_instr_sim=args.fast_instr_sim,
+        use_rapidfuzz=args.rapidfuzz,
+        workers=args.workers,
+        workers_kind=args.workers_kind
     )
     
     if results:
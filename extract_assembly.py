@@ -3,17 +3,105 @@
 import json
 import os
 import sys
+from pathlib import Path
 
-# Check command line arguments
-if len(sys.argv) < 2:
-    print("Usage: python extract_assembly.py <json_file_path> [output_directory]")
+try:
+    # C-accelerated JSON parsing and serialization
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Incremental parsing for --stream, picks the C (yajl2_c) backend automatically when built
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def load_json(path):
+    """Load a JSON file, using orjson when available"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson rejects the NaN/Infinity tokens that json.dump writes by default
+            return json.loads(raw)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_json(data, path):
+    """Write data as 2-space indented JSON (stdlib json, which keeps NaN/Infinity intact)"""
+    Path(path).write_bytes(json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+
+
+def iter_problems(path, stream=False):
+    """
+    Yield (problem_id, problem_data) for every entry under '<key>.problems'
+
+    By default the whole file is loaded. With stream=True a single ijson pass
+    builds one problem at a time, keeping memory flat on very large files.
+    """
+    if not stream:
+        for value in load_json(path).values():
+            if 'problems' in value:
+                yield from value['problems'].items()
+        return
+
+    problems_prefix = None
+    builder = None
+    try:
+        with open(path, 'rb') as f:
+            # use_float keeps numbers as float instead of Decimal so they serialize unchanged
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if builder is not None:
+                    # Feed the current problem's events until its value is complete
+                    builder.event(event, value)
+                    if event in ('start_map', 'start_array'):
+                        depth += 1
+                    elif event in ('end_map', 'end_array'):
+                        depth -= 1
+                    if depth == 0:
+                        yield problem_id, builder.value
+                        builder = None
+                elif prefix == '' and event == 'map_key':
+                    problems_prefix = f'{value}.problems'
+                elif prefix == problems_prefix and event == 'map_key':
+                    problem_id = value
+                    builder = ijson.ObjectBuilder()
+                    depth = 0
+    except ijson.JSONError as e:
+        # yajl rejects the NaN/Infinity tokens that json.dump writes for non-finite floats
+        print(f"\nError: --stream could not parse '{path}': {e}")
+        print("Files containing NaN/Infinity values must be extracted without --stream")
+        sys.exit(1)
+
+
+# Markdown code block markers around unoptimized_assembly
+ASM_FENCE_OPEN = '```assembly\n'
+ASM_FENCE_CLOSE = '```'
+
+# Check command line arguments (--stream may appear anywhere)
+args = sys.argv[1:]
+stream = '--stream' in args
+if stream:
+    args.remove('--stream')
+if len(args) < 1:
+    print("Usage: python extract_assembly.py <json_file_path> [output_directory] [--stream]")
     print("Example: python extract_assembly.py untitled.json")
     print("Example: python extract_assembly.py data.json output_folder")
+    print("Example: python extract_assembly.py huge.json output_folder --stream  # low memory, needs ijson")
+    sys.exit(1)
+
+if stream and ijson is None:
+    print("Error: --stream requires the ijson package (pip install ijson)")
     sys.exit(1)
 
 # Get input file and output directory
-json_file = sys.argv[1]
-output_dir = sys.argv[2] if len(sys.argv) > 2 else 'assembly_output'
+json_file = args[0]
+output_dir = args[1] if len(args) > 1 else 'assembly_output'
 
 # Check if file exists
 if not os.path.exists(json_file):
@@ -22,10 +110,6 @@ if not os.path.exists(json_file):
 
 print(f"Reading file: {json_file}")
 
-# Read JSON file
-with open(json_file, 'r') as f:
-    data = json.load(f)
-
 # Create output directory
 os.makedirs(output_dir, exist_ok=True)
 print(f"Output directory: {output_dir}\n")
@@ -35,87 +119,80 @@ total_problems = 0
 compiled_problems = 0
 files_generated = 0
 
-# Iterate through all problems
-for key, value in data.items():
-    if 'problems' in value:
-        problems = value['problems']
+# Iterate through all problems (decoded one at a time with --stream)
+for problem_id, problem_data in iter_problems(json_file, stream):
+    total_problems += 1
+    
+    # Only process problems that compiled successfully
+    if problem_data.get('compilation_failed') == False:
+        compiled_problems += 1
+        print(f"Processing problem {problem_id}...")
         
-        for problem_id, problem_data in problems.items():
-            total_problems += 1
-            
-            # Only process problems that compiled successfully
-            if problem_data.get('compilation_failed') == False:
-                compiled_problems += 1
-                print(f"Processing problem {problem_id}...")
-                
-                # Create a separate folder for each problem
-                problem_dir = os.path.join(output_dir, f"problem_{problem_id}")
-                os.makedirs(problem_dir, exist_ok=True)
+        # Create a separate folder for each problem
+        problem_dir = os.path.join(output_dir, f"problem_{problem_id}")
+        os.makedirs(problem_dir, exist_ok=True)
+        
+        # Prepare samples data
+        samples_data = {}
+        
+        # Extract generated_assembly from samples
+        if 'samples' in problem_data:
+            for sample_id, sample_data in problem_data['samples'].items():
+                # Save complete sample information (except assembly code, saved separately)
+                sample_info = {}
                 
-                # Prepare samples data
-                samples_data = {}
+                for key, val in sample_data.items():
+                    if key != 'generated_assembly':
+                        sample_info[key] = val
                 
-                # Extract generated_assembly from samples
-                if 'samples' in problem_data:
-                    for sample_id, sample_data in problem_data['samples'].items():
-                        # Save complete sample information (except assembly code, saved separately)
-                        sample_info = {}
-                        
-                        for key, val in sample_data.items():
-                            if key != 'generated_assembly':
-                                sample_info[key] = val
-                        
-                        samples_data[sample_id] = sample_info
-                        
-                        # Extract and save generated_assembly
-                        if 'generated_assembly' in sample_data:
-                            generated_asm = sample_data['generated_assembly']
-                            
-                            # Write generated_assembly
-                            gen_filename = os.path.join(problem_dir, f"sample_{sample_id}_generated.s")
-                            with open(gen_filename, 'w') as f:
-                                f.write(generated_asm)
-                            print(f"  Generated file: {gen_filename}")
-                            files_generated += 1
-                            
-                            # Record assembly file path in sample_info
-                            sample_info['generated_assembly_file'] = f"sample_{sample_id}_generated.s"
+                samples_data[sample_id] = sample_info
                 
-                # Extract unoptimized_assembly
-                if 'unoptimized_assembly' in problem_data:
-                    unopt_asm = problem_data['unoptimized_assembly']
+                # Extract and save generated_assembly
+                if 'generated_assembly' in sample_data:
+                    generated_asm = sample_data['generated_assembly']
                     
-                    # Remove possible markdown code block markers
-                    if unopt_asm.startswith('```assembly'):
-                        unopt_asm = unopt_asm.split('```assembly\n', 1)[1]
-                    if unopt_asm.endswith('```'):
-                        unopt_asm = unopt_asm.rsplit('```', 1)[0]
-                    
-                    # Write unoptimized_assembly
-                    unopt_filename = os.path.join(problem_dir, "unoptimized.s")
-                    with open(unopt_filename, 'w') as f:
-                        f.write(unopt_asm)
-                    print(f"  Generated file: {unopt_filename}")
+                    # Write generated_assembly
+                    gen_filename = os.path.join(problem_dir, f"sample_{sample_id}_generated.s")
+                    Path(gen_filename).write_bytes(generated_asm.encode('utf-8'))
+                    print(f"  Generated file: {gen_filename}")
                     files_generated += 1
-                
-                # Save samples information to JSON file
-                samples_json = {
-                    'problem_id': problem_id,
-                    'compilation_failed': problem_data.get('compilation_failed'),
-                    'best_sample_id': problem_data.get('best_sample_id'),
-                    'overall_correct': problem_data.get('overall_correct'),
-                    'best_speedup': problem_data.get('best_speedup'),
-                    'unoptimized_assembly_file': 'unoptimized.s',
-                    'samples': samples_data
-                }
-                
-                samples_json_file = os.path.join(problem_dir, "samples.json")
-                with open(samples_json_file, 'w', encoding='utf-8') as f:
-                    json.dump(samples_json, f, indent=2, ensure_ascii=False)
-                print(f"  Generated file: {samples_json_file}")
-                files_generated += 1
-                
-                print()
+                    
+                    # Record assembly file path in sample_info
+                    sample_info['generated_assembly_file'] = f"sample_{sample_id}_generated.s"
+        
+        # Extract unoptimized_assembly
+        if 'unoptimized_assembly' in problem_data:
+            unopt_asm = problem_data['unoptimized_assembly']
+            
+            # Remove possible markdown code block markers
+            if unopt_asm.startswith(ASM_FENCE_OPEN):
+                unopt_asm = unopt_asm[len(ASM_FENCE_OPEN):]
+            if unopt_asm.endswith(ASM_FENCE_CLOSE):
+                unopt_asm = unopt_asm[:-len(ASM_FENCE_CLOSE)]
+            
+            # Write unoptimized_assembly
+            unopt_filename = os.path.join(problem_dir, "unoptimized.s")
+            Path(unopt_filename).write_bytes(unopt_asm.encode('utf-8'))
+            print(f"  Generated file: {unopt_filename}")
+            files_generated += 1
+        
+        # Save samples information to JSON file
+        samples_json = {
+            'problem_id': problem_id,
+            'compilation_failed': problem_data.get('compilation_failed'),
+            'best_sample_id': problem_data.get('best_sample_id'),
+            'overall_correct': problem_data.get('overall_correct'),
+            'best_speedup': problem_data.get('best_speedup'),
+            'unoptimized_assembly_file': 'unoptimized.s',
+            'samples': samples_data
+        }
+        
+        samples_json_file = os.path.join(problem_dir, "samples.json")
+        dump_json(samples_json, samples_json_file)
+        print(f"  Generated file: {samples_json_file}")
+        files_generated += 1
+        
+        print()
 
 print(f"{'='*60}")
 print(f"Complete!")